@@ -45,6 +45,8 @@ def loadDefaultParams(Cmat=None, Dmat=None, lookupTableFileName=None, seed=None)
     params.distr_delay = 0  # if 1, use distributed delays instead of fixed
     params.filter_sigma = 0  # if 1, filter sigmae/sigmai
     params.fast_interp = 1  # if 1, Interpolate the value from the look-up table instead of taking the closest value
+    params.sparse_threshold = 0.5  # use a sparse Cmat for the network input if its fraction of zeros is larger
+    params.coupling_dtype = "float64"  # precision of Cmat in the network input, "float32" halves its memory traffic
 
     # ------------------------------------------------------------------------
     # global whole-brain network parameters
@@ -178,20 +180,50 @@ def loadDefaultParams(Cmat=None, Dmat=None, lookupTableFileName=None, seed=None)
     if lookupTableFileName is None:
         lookupTableFileName = os.path.join(os.path.dirname(__file__), "aln-precalc", "quantities_cascade.h5")
 
-    hf = h5py.File(lookupTableFileName, "r")
-    params.Irange = hf.get("mu_vals")[()]
-    params.sigmarange = hf.get("sigma_vals")[()]
+    (
+        params.Irange,
+        params.sigmarange,
+        params.precalc_r,
+        params.precalc_V,
+        params.precalc_tau_mu,
+        params.precalc_tau_sigma,
+    ) = loadLookupTables(lookupTableFileName)
     params.dI = params.Irange[1] - params.Irange[0]
     params.ds = params.sigmarange[1] - params.sigmarange[0]
 
-    params.precalc_r = hf.get("r_ss")[()][()]
-    params.precalc_V = hf.get("V_mean_ss")[()]
-    params.precalc_tau_mu = hf.get("tau_mu_exp")[()]
-    params.precalc_tau_sigma = hf.get("tau_sigma_exp")[()]
-
     return params
 
 
+# lookup tables that have already been loaded, see loadLookupTables()
+_lookupTableCache = {}
+
+
+def loadLookupTables(lookupTableFileName):
+    """Load the precomputed aLN transfer functions from an hdf5 file.
+
+    The tables are read only once per file and shared between all models that use it,
+    they are therefore read-only. A file that has been modified since is read again.
+
+    :param lookupTableFileName: Filename of the lookup table
+    :type lookupTableFileName: str
+
+    :return: Ranges of the mean input and its standard deviation, and the tables of the rate,
+        the mean membrane potential and the time constants tau_mu and tau_sigma
+    :rtype: tuple[numpy.ndarray]
+    """
+    cacheKey = (os.path.abspath(lookupTableFileName), os.path.getmtime(lookupTableFileName))
+    if cacheKey not in _lookupTableCache:
+        with h5py.File(lookupTableFileName, "r") as hf:
+            tables = tuple(
+                hf.get(name)[()]
+                for name in ["mu_vals", "sigma_vals", "r_ss", "V_mean_ss", "tau_mu_exp", "tau_sigma_exp"]
+            )
+        for table in tables:
+            table.flags.writeable = False
+        _lookupTableCache[cacheKey] = tables
+    return _lookupTableCache[cacheKey]
+
+
 def computeDelayMatrix(lengthMat, signalV, segmentLength=1):
     """
     Compute the delay matrix from the fiber length matrix and the signal
@@ -60,7 +60,10 @@ class ALNModel(Model):
         :param Dmat: Distance matrix between all nodes (in mm)
         :param lookupTableFileName: Filename for precomputed transfer functions and tables
         :param seed: Random number generator seed
-        :param simulateChunkwise: Chunkwise time integration (for lower memory use)
+
+        For lower memory use, integrate chunkwise with `run(chunkwise=True, chunksize=...)`. Only the output
+        variables `rates_exc`, `rates_inh` and `IA` hold a history during integration, all other state variables
+        are kept per node. Between chunks, only the last `maxDelay + 1` steps of the history are kept as the model state.
         """
 
         # Global attributes
@@ -69,7 +72,10 @@ class ALNModel(Model):
         self.lookupTableFileName = lookupTableFileName  # Filename for aLN lookup functions
         self.seed = seed  # Random seed
 
-        integration = ti.timeIntegration
+        # integer delay matrix of the current run, see run()
+        self._Dmat_ndt = None
+
+        integration = self.timeIntegration
 
         # load default parameters if none were given
         if params is None:
@@ -80,9 +86,25 @@ class ALNModel(Model):
         # Initialize base class Model
         super().__init__(integration=integration, params=params)
 
+    def run(self, *args, **kwargs):
+        # compute the integer delay matrix once per run, it is used by getMaxDelay() and
+        # by all chunks of a chunkwise integration instead of being recomputed for every chunk
+        self._Dmat_ndt = ti.computeDelayMatrixNdt(self.params)
+        try:
+            super().run(*args, **kwargs)
+        finally:
+            self._Dmat_ndt = None
+
+    def timeIntegration(self, params):
+        # outside of run(), e.g. for direct calls of autochunk(), the delays are computed from params
+        return ti.timeIntegration(params, Dmat_ndt=getattr(self, "_Dmat_ndt", None))
+
     def getMaxDelay(self):
+        Dmat_ndt = getattr(self, "_Dmat_ndt", None)
+        if Dmat_ndt is None:
+            Dmat_ndt = ti.computeDelayMatrixNdt(self.params)
+
         # compute maximum delay of model
         ndt_de = round(self.params["de"] / self.params["dt"])
         ndt_di = round(self.params["di"] / self.params["dt"])
-        max_dmat_delay = super().getMaxDelay()
-        return int(max(max_dmat_delay, ndt_de, ndt_di))
+        return int(max(Dmat_ndt.max(), ndt_de, ndt_di))
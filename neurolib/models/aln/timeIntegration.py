@@ -4,7 +4,7 @@ import numba
 from . import loadDefaultParams as dp
 
 
-def timeIntegration(params):
+def timeIntegration(params, Dmat_ndt=None):
     """Sets up the parameters for time integration
     
     Return:
@@ -23,8 +23,14 @@ def timeIntegration(params):
       siev :      N vector    : final value of siev  for each node
       siiv :      N vector    : final value of siiv  for each node
 
+    The model is integrated with a fixed-step Euler-Maruyama scheme. An adaptive step size
+    (e.g. Tsit5 or RK45) does not apply here: the delays are stored as multiples of dt,
+    the noise is drawn on the same grid, and the outputs are sampled at every dt.
+
     :param params: Parameter dictionary of the model
     :type params: dict
+    :param Dmat_ndt: Delay matrix in multiples of dt, computed from params if not given
+    :type Dmat_ndt: numpy.ndarray, optional
     :return: Integrated activity variables of the model
     :rtype: (numpy.ndarray,)
     """
@@ -40,25 +46,18 @@ def timeIntegration(params):
 
     # Connectivity matric
     # Interareal relative coupling strengths (values between 0 and 1), Cmat(i,j) connnection from jth to ith
-    Cmat = params["Cmat"]
+    # the coupling can be stored in single precision to halve the memory traffic of the network input,
+    # the row sums are still accumulated in double precision
+    Cmat = np.ascontiguousarray(params["Cmat"], dtype=params.get("coupling_dtype", "float64"))
     c_gl = params["c_gl"]  # EPSP amplitude between areas
     Ke_gl = params["Ke_gl"]  # number of incoming E connections (to E population) from each area
 
     N = len(Cmat)  # Number of areas
 
-    # Interareal connection delay
-    lengthMat = params["lengthMat"]
-    signalV = params["signalV"]
-
-    if N == 1:
-        Dmat = np.ones((N, N)) * params["de"]
-    else:
-        Dmat = dp.computeDelayMatrix(
-            lengthMat, signalV
-        )  # Interareal connection delays, Dmat(i,j) Connnection from jth node to ith (ms)
-        Dmat[np.eye(len(Dmat)) == 1] = np.ones(len(Dmat)) * params["de"]
-
-    Dmat_ndt = np.around(Dmat / dt).astype(int)  # delay matrix in multiples of dt
+    # Interareal connection delay in multiples of dt
+    # ALNModel.run() passes the delay matrix of the run, so that it is not recomputed for every chunk
+    if Dmat_ndt is None:
+        Dmat_ndt = computeDelayMatrixNdt(params)
 
     # ------------------------------------------------------------------------
 
@@ -138,18 +137,21 @@ def timeIntegration(params):
     # ------------------------------------------------------------------------
 
     # Lookup tables for the transfer functions
+    # make sure that numba receives contiguous, read-only float64 tables so that the
+    # compiled (and cached) kernel can be reused across runs. numba compiles a separate
+    # kernel for writeable arrays, as they are e.g. in deep-copied or user-supplied params
     precalc_r, precalc_V, precalc_tau_mu, precalc_tau_sigma = (
-        params["precalc_r"],
-        params["precalc_V"],
-        params["precalc_tau_mu"],
-        params["precalc_tau_sigma"],
+        _readonlyTable(params["precalc_r"]),
+        _readonlyTable(params["precalc_V"]),
+        _readonlyTable(params["precalc_tau_mu"]),
+        _readonlyTable(params["precalc_tau_sigma"]),
     )
 
     # parameter for the lookup tables
     dI = params["dI"]
     ds = params["ds"]
-    sigmarange = params["sigmarange"]
-    Irange = params["Irange"]
+    sigmarange = _readonlyTable(params["sigmarange"])
+    Irange = _readonlyTable(params["Irange"])
 
     # Initialization
     # Floating point issue in np.arange() workaraound: use integers in np.arange()
@@ -169,11 +171,46 @@ def timeIntegration(params):
     max_global_delay = max(np.max(Dmat_ndt), ndt_de, ndt_di)
     startind = int(max_global_delay + 1)
 
+    # if all interareal delays are equal (e.g. for signalV = 0), every node sends the same delayed
+    # rate to all other nodes and the network input reduces to a matrix-vector product instead of
+    # a gather of N*N delayed rates per time step
+    offdiag_ndt = Dmat_ndt[~np.eye(N, dtype=bool)]
+    homogeneous_delay = bool(N > 1 and not distr_delay and np.all(offdiag_ndt == offdiag_ndt[0]))
+    ndt_gl = int(offdiag_ndt[0]) if homogeneous_delay else 0
+    # the matrix-vector products are done in double precision, independent of coupling_dtype
+    rd_gl = np.zeros(N)  # delayed rates for the homogeneous case
+    if homogeneous_delay:
+        # the local term Cmat[i, i] has its own delay, it is added separately
+        Cmat_gl = Cmat.astype(np.float64)
+        np.fill_diagonal(Cmat_gl, 0.0)
+        Cmat_gl_sq = Cmat_gl ** 2
+    else:
+        # not used by the kernel, empty arrays keep the compiled signature and save the setup per chunk
+        Cmat_gl = Cmat_gl_sq = np.empty((0, 0))
+
+    # for sparse connectomes, only gather the delayed rates of existing connections using
+    # a compressed sparse row (CSR) representation of Cmat (column indices sorted per row)
+    sparse_coupling = bool(
+        N > 1 and not homogeneous_delay and not distr_delay and np.mean(Cmat == 0) > params.get("sparse_threshold", 0.5)
+    )
+    if sparse_coupling:
+        Cmat_nonzero = Cmat != 0
+        Cmat_indptr = np.concatenate((np.zeros(1, dtype=np.int64), np.cumsum(Cmat_nonzero.sum(axis=1))))
+        Cmat_indices = np.ascontiguousarray(np.nonzero(Cmat_nonzero)[1], dtype=np.int64)
+        Cmat_data = Cmat[Cmat_nonzero]
+    else:
+        Cmat_indptr = Cmat_indices = np.empty(0, dtype=np.int64)
+        Cmat_data = np.empty(0, dtype=Cmat.dtype)
+
     # state variable arrays, have length of t + startind
     # they store initial conditions AND simulated data
-    rates_exc = np.zeros((N, startind + len(t)))
-    rates_inh = np.zeros((N, startind + len(t)))
-    IA = np.zeros((N, startind + len(t)))
+    # only the output variables keep a history, all other state variables
+    # are stored as one contiguous array of shape (N,) per variable (see below)
+    # the histories are completely overwritten by the initial conditions and
+    # the noise / integration, so we don't need to zero them first
+    rates_exc = np.empty((N, startind + len(t)))
+    rates_inh = np.empty((N, startind + len(t)))
+    IA = np.empty((N, startind + len(t)))
 
     # ------------------------------------------------------------------------
     # Set initial values
@@ -206,21 +243,22 @@ def timeIntegration(params):
         rates_inh_init = params["rates_inh_init"][:, -startind:]
         IA_init = params["IA_init"][:, -startind:]
 
-    if RNGseed:
-        np.random.seed(RNGseed)
+    # Draw the noise with the SFC64 generator, which is considerably faster than the legacy
+    # Mersenne Twister. Without a seed, the generator is seeded from numpy's global RNG
+    # so that runs can still be reproduced with np.random.seed()
+    rng = np.random.Generator(np.random.SFC64(RNGseed if RNGseed else np.random.randint(2 ** 31)))
 
-    # Save the noise in the rates array to save memory
-    rates_exc[:, startind:] = np.random.standard_normal((N, len(t)))
-    rates_inh[:, startind:] = np.random.standard_normal((N, len(t)))
+    # Save the noise in the rates array to save memory. The noise of all nodes is drawn in one
+    # vectorized call per population from a single generator, so that a seeded run does not
+    # depend on the number of threads, as it would with per-thread generators in a prange loop
+    rates_exc[:, startind:] = rng.standard_normal((N, len(t)))
+    rates_inh[:, startind:] = rng.standard_normal((N, len(t)))
 
     # Set the initial conditions
     rates_exc[:, :startind] = rates_exc_init
     rates_inh[:, :startind] = rates_inh_init
     IA[:, :startind] = IA_init
 
-    noise_exc = np.zeros((N,))
-    noise_inh = np.zeros((N,))
-
     # tile external inputs to appropriate shape
     ext_exc_current = adjust_shape(params["ext_exc_current"], rates_exc)
     ext_inh_current = adjust_shape(params["ext_inh_current"], rates_exc)
@@ -235,7 +273,6 @@ def timeIntegration(params):
         distr_delay,
         filter_sigma,
         Cmat,
-        Dmat,
         c_gl,
         Ke_gl,
         tau_ou,
@@ -299,6 +336,15 @@ def timeIntegration(params):
         rates_inh,
         rd_exc,
         rd_inh,
+        homogeneous_delay,
+        ndt_gl,
+        Cmat_gl,
+        Cmat_gl_sq,
+        rd_gl,
+        sparse_coupling,
+        Cmat_indptr,
+        Cmat_indices,
+        Cmat_data,
         sqrt_dt,
         startind,
         ndt_de,
@@ -309,19 +355,45 @@ def timeIntegration(params):
         ext_inh_rate,
         ext_exc_current,
         ext_inh_current,
-        noise_exc,
-        noise_inh,
     )
 
 
-@numba.njit(locals={"idxX": numba.int64, "idxY": numba.int64, "idx1": numba.int64, "idy1": numba.int64})
+def _readonlyTable(table):
+    """Returns a contiguous, read-only float64 view of a lookup table without copying it if possible."""
+    table = np.ascontiguousarray(table, dtype=np.float64).view()
+    table.flags.writeable = False
+    return table
+
+
+def computeDelayMatrixNdt(params):
+    """Computes the delay matrix of the network in multiples of dt. The diagonal
+    (the delay of the local E-E coupling) is set to the local delay `de`.
+
+    :param params: Parameter dictionary of the model
+    :type params: dict
+    :return: Delay matrix in multiples of dt, Dmat_ndt(i,j) Connnection from jth node to ith
+    :rtype: numpy.ndarray
+    """
+    N = len(params["Cmat"])
+
+    if N == 1:
+        Dmat = np.ones((N, N)) * params["de"]
+    else:
+        Dmat = dp.computeDelayMatrix(
+            params["lengthMat"], params["signalV"]
+        )  # Interareal connection delays, Dmat(i,j) Connnection from jth node to ith (ms)
+        Dmat[np.eye(len(Dmat)) == 1] = np.ones(len(Dmat)) * params["de"]
+
+    return np.around(Dmat / params["dt"]).astype(np.int32)
+
+
+@numba.njit(locals={"idxX": numba.int64, "idxY": numba.int64, "idx1": numba.int64, "idy1": numba.int64}, cache=True)
 def timeIntegration_njit_elementwise(
     dt,
     duration,
     distr_delay,
     filter_sigma,
     Cmat,
-    Dmat,
     c_gl,
     Ke_gl,
     tau_ou,
@@ -385,6 +457,15 @@ def timeIntegration_njit_elementwise(
     rates_inh,
     rd_exc,
     rd_inh,
+    homogeneous_delay,
+    ndt_gl,
+    Cmat_gl,
+    Cmat_gl_sq,
+    rd_gl,
+    sparse_coupling,
+    Cmat_indptr,
+    Cmat_indices,
+    Cmat_data,
     sqrt_dt,
     startind,
     ndt_de,
@@ -395,8 +476,6 @@ def timeIntegration_njit_elementwise(
     ext_inh_rate,
     ext_exc_current,
     ext_inh_current,
-    noise_exc,
-    noise_inh,
 ):
 
     # squared Jee_max
@@ -415,12 +494,50 @@ def timeIntegration_njit_elementwise(
         sigmae_f = sigmae_ext
         sigmai_f = sigmai_ext
 
+    # inverse grid widths of the lookup tables, to multiply instead of divide in every lookup
+    inv_ds = 1.0 / ds
+    inv_dI = 1.0 / dI
+
+    # noise amplitude of the ornstein-uhlenbeck processes
+    sigma_ou_sqrt_dt = sigma_ou * sqrt_dt
+
+    # network input for homogeneous delays or sparse coupling
+    rowsums = np.zeros(N)
+    rowsumsqs = np.zeros(N)
+
     ### integrate ODE system:
     for i in range(startind, startind + len(t)):
 
-        if not distr_delay:
+        if homogeneous_delay:
+            # all interareal delays are equal: read the delayed rate of each node only once
+            for no in range(N):
+                rd_gl[no] = rates_exc[no, i - ndt_gl - 1] * 1e-3  # convert Hz to kHz
+                rd_exc[no, no] = rates_exc[no, i - Dmat_ndt[no, no] - 1] * 1e-3  # convert Hz to kHz
+                rd_inh[no] = rates_inh[no, i - ndt_di - 1] * 1e-3  # convert Hz to kHz
+            rowsums[:] = np.dot(Cmat_gl, rd_gl)
+            rowsumsqs[:] = np.dot(Cmat_gl_sq, rd_gl)
+
+        elif sparse_coupling:
+            for no in range(N):
+                rd_exc[no, no] = rates_exc[no, i - Dmat_ndt[no, no] - 1] * 1e-3  # convert Hz to kHz
+                rd_inh[no] = rates_inh[no, i - ndt_di - 1] * 1e-3  # convert Hz to kHz
+                # only the nonzero entries of Cmat contribute to the row sums
+                rowsum = 0.0
+                rowsumsq = 0.0
+                for k in range(Cmat_indptr[no], Cmat_indptr[no + 1]):
+                    col = Cmat_indices[k]
+                    rd = rates_exc[col, i - Dmat_ndt[no, col] - 1] * 1e-3  # convert Hz to kHz
+                    rowsum = rowsum + Cmat_data[k] * rd
+                    rowsumsq = rowsumsq + Cmat_data[k] ** 2 * rd
+                rowsums[no] = rowsum
+                rowsumsqs[no] = rowsumsq
+
+        elif not distr_delay:
             # Get the input from one node into another from the rates at time t - connection_delay - 1
             # remark: assume Kie == Kee and Kei == Kii
+            # Note: the rate histories are stored node-major, i.e. with shape (N, t). Since the delays
+            # differ for every pair of nodes, the inner loop reads one source node's history at different
+            # lags, which stays within one row. A time-major layout would make these reads strided.
             for no in range(N):
                 # interareal coupling
                 for l in range(N):
@@ -433,18 +550,26 @@ def timeIntegration_njit_elementwise(
         for no in range(N):
 
             # To save memory, noise is saved in the rates array
-            noise_exc[no] = rates_exc[no, i]
-            noise_inh[no] = rates_inh[no, i]
+            noise_exc = rates_exc[no, i]
+            noise_inh = rates_inh[no, i]
 
             mue = Jee_max * seem[no] + Jei_max * seim[no] + mue_ou[no] + ext_exc_current[no, i]
             mui = Jie_max * siem[no] + Jii_max * siim[no] + mui_ou[no] + ext_inh_current[no, i]
 
             # compute row sum of Cmat*rd_exc and Cmat**2*rd_exc
-            rowsum = 0
-            rowsumsq = 0
-            for col in range(N):
-                rowsum = rowsum + Cmat[no, col] * rd_exc[no, col]
-                rowsumsq = rowsumsq + Cmat[no, col] ** 2 * rd_exc[no, col]
+            if homogeneous_delay:
+                # add the local term to the precomputed matrix-vector products
+                rowsum = rowsums[no] + Cmat[no, no] * rd_exc[no, no]
+                rowsumsq = rowsumsqs[no] + Cmat[no, no] ** 2 * rd_exc[no, no]
+            elif sparse_coupling:
+                rowsum = rowsums[no]
+                rowsumsq = rowsumsqs[no]
+            else:
+                rowsum = 0
+                rowsumsq = 0
+                for col in range(N):
+                    rowsum = rowsum + Cmat[no, col] * rd_exc[no, col]
+                    rowsumsq = rowsumsq + Cmat[no, col] ** 2 * rd_exc[no, col]
 
             # z1: weighted sum of delayed rates, weights=c*K
             z1ee = (
@@ -487,7 +612,7 @@ def timeIntegration_njit_elementwise(
             # ------- excitatory population
             # mufe[no] - IA[no] / C is the total current of the excitatory population
             xid1, yid1, dxid, dyid = fast_interp2_opt(
-                sigmarange, ds, sigmae_f, Irange, dI, mufe[no] - IA[no, i - 1] / C
+                sigmarange, inv_ds, sigmae_f, Irange, inv_dI, mufe[no] - IA[no, i - 1] / C
             )
             xid1, yid1 = int(xid1), int(yid1)
 
@@ -499,7 +624,7 @@ def timeIntegration_njit_elementwise(
 
             # ------- inhibitory population
             #  mufi[no] are the (filtered) currents of the inhibitory population
-            xid1, yid1, dxid, dyid = fast_interp2_opt(sigmarange, ds, sigmai_f, Irange, dI, mufi[no])
+            xid1, yid1, dxid, dyid = fast_interp2_opt(sigmarange, inv_ds, sigmai_f, Irange, inv_dI, mufi[no])
             xid1, yid1 = int(xid1), int(yid1)
 
             rates_inh[no, i] = interpolate_values(precalc_r, xid1, yid1, dxid, dyid) * 1e3
@@ -575,16 +700,16 @@ def timeIntegration_njit_elementwise(
 
             # ornstein-uhlenbeck process
             mue_ou[no] = (
-                mue_ou[no] + (mue_ext_mean - mue_ou[no]) * dt / tau_ou + sigma_ou * sqrt_dt * noise_exc[no]
+                mue_ou[no] + (mue_ext_mean - mue_ou[no]) * dt / tau_ou + sigma_ou_sqrt_dt * noise_exc
             )  # mV/ms
             mui_ou[no] = (
-                mui_ou[no] + (mui_ext_mean - mui_ou[no]) * dt / tau_ou + sigma_ou * sqrt_dt * noise_inh[no]
+                mui_ou[no] + (mui_ext_mean - mui_ou[no]) * dt / tau_ou + sigma_ou_sqrt_dt * noise_inh
             )  # mV/ms
 
     return t, rates_exc, rates_inh, mufe, mufi, IA, seem, seim, siem, siim, seev, seiv, siev, siiv, mue_ou, mui_ou
 
 
-@numba.njit(locals={"idxX": numba.int64, "idxY": numba.int64})
+@numba.njit(locals={"idxX": numba.int64, "idxY": numba.int64}, cache=True)
 def interpolate_values(table, xid1, yid1, dxid, dyid):
     output = (
         table[yid1, xid1] * (1 - dxid) * (1 - dyid)
@@ -595,7 +720,7 @@ def interpolate_values(table, xid1, yid1, dxid, dyid):
     return output
 
 
-@numba.njit(locals={"idxX": numba.int64, "idxY": numba.int64})
+@numba.njit(locals={"idxX": numba.int64, "idxY": numba.int64}, cache=True)
 def lookup_no_interp(x, dx, xi, y, dy, yi):
 
     """
@@ -644,12 +769,16 @@ def adjust_shape(original, target):
     it has the same shape as target at the end.
     This is used to make sure that any input parameter like external current has
     the same shape as the rate array.
+    The result is always a C-contiguous float64 array so that numba can read it
+    with unit stride and does not compile a kernel per input layout.
     """
 
-    # make an ext_exc_current ARRAY from a LIST or INT
+    # constant inputs (the default) and inputs of the right shape need no tiling
     if not hasattr(original, "__len__"):
-        original = [original]
+        return np.full(target.shape, original, dtype=np.float64)
     original = np.array(original)
+    if original.shape == target.shape:
+        return np.ascontiguousarray(original, dtype=np.float64)
 
     # repeat original in y until larger (or same size) as target
 
@@ -678,11 +807,13 @@ def adjust_shape(original, target):
     # cut from end because the beginning can be initial condition
     original = original[: target.shape[0], -target.shape[1] :]
 
-    return original
+    return np.ascontiguousarray(original, dtype=np.float64)
 
 
-@numba.njit(locals={"xid1": numba.int64, "yid1": numba.int64, "dxid": numba.float64, "dyid": numba.float64})
-def fast_interp2_opt(x, dx, xi, y, dy, yi):
+@numba.njit(
+    locals={"xid1": numba.int64, "yid1": numba.int64, "dxid": numba.float64, "dyid": numba.float64}, cache=True
+)
+def fast_interp2_opt(x, inv_dx, xi, y, inv_dy, yi):
 
     """
     Returns the values needed for interpolation:
@@ -692,7 +823,7 @@ def fast_interp2_opt(x, dx, xi, y, dy, yi):
 
     x     ... range of the x value
     xi    ... interpolation value on x-axis
-    dx    ... grid width of x ( dx = x[1]-x[0] )
+    inv_dx ... inverse grid width of x ( inv_dx = 1 / (x[1]-x[0]) )
     (same for y)
 
     return:   xid1    ... index of the lower interpolation value
@@ -701,12 +832,13 @@ def fast_interp2_opt(x, dx, xi, y, dy, yi):
     """
 
     # within all boundaries
+    # (the lower index is clamped, since multiplying with the inverse grid width can round up to the last grid point)
     if xi >= x[0] and xi < x[-1] and yi >= y[0] and yi < y[-1]:
-        xid = (xi - x[0]) / dx
-        xid1 = np.floor(xid)
+        xid = (xi - x[0]) * inv_dx
+        xid1 = min(np.floor(xid), len(x) - 2)
         dxid = xid - xid1
-        yid = (yi - y[0]) / dy
-        yid1 = np.floor(yid)
+        yid = (yi - y[0]) * inv_dy
+        yid1 = min(np.floor(yid), len(y) - 2)
         dyid = yid - yid1
         return xid1, yid1, dxid, dyid
 
@@ -715,8 +847,8 @@ def fast_interp2_opt(x, dx, xi, y, dy, yi):
         yid1 = 0
         dyid = 0.0
         if xi >= x[0] and xi < x[-1]:
-            xid = (xi - x[0]) / dx
-            xid1 = np.floor(xid)
+            xid = (xi - x[0]) * inv_dx
+            xid1 = min(np.floor(xid), len(x) - 2)
             dxid = xid - xid1
 
         elif xi < x[0]:
@@ -731,8 +863,8 @@ def fast_interp2_opt(x, dx, xi, y, dy, yi):
         yid1 = -1
         dyid = 0.0
         if xi >= x[0] and xi < x[-1]:
-            xid = (xi - x[0]) / dx
-            xid1 = np.floor(xid)
+            xid = (xi - x[0]) * inv_dx
+            xid1 = min(np.floor(xid), len(x) - 2)
             dxid = xid - xid1
 
         elif xi < x[0]:
@@ -748,8 +880,8 @@ def fast_interp2_opt(x, dx, xi, y, dy, yi):
         xid1 = 0
         dxid = 0.0
         # We know that yi is within the boundaries
-        yid = (yi - y[0]) / dy
-        yid1 = np.floor(yid)
+        yid = (yi - y[0]) * inv_dy
+        yid1 = min(np.floor(yid), len(y) - 2)
         dyid = yid - yid1
         return xid1, yid1, dxid, dyid
 
@@ -757,8 +889,8 @@ def fast_interp2_opt(x, dx, xi, y, dy, yi):
         xid1 = -1
         dxid = 0.0
         # We know that yi is within the boundaries
-        yid = (yi - y[0]) / dy
-        yid1 = np.floor(yid)
+        yid = (yi - y[0]) * inv_dy
+        yid1 = min(np.floor(yid), len(y) - 2)
         dyid = yid - yid1
 
     return xid1, yid1, dxid, dyid
@@ -365,8 +365,9 @@ class Model:
     def setStateVariables(self, name, data):
         """Saves the models current state variables. 
         
-        TODO: Cut state variables to length of self.maxDelay
-        However, this could be time-memory tradeoff
+        Temporal state variables are cut to their last `self.startindt` (maxDelay + 1) steps,
+        which is all the history that is needed to continue the integration. This bounds
+        the memory of the state to O(N * maxDelay) for chunkwise integration.
         
         :param name: name of the state variable
         :type name: str
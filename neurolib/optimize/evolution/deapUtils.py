@@ -97,7 +97,7 @@ def selRank(pop, k, s=1.5):
     :rtype: list
     """
     # Sort individual according to their rank, the first indiv in the list is the one with the best fitness
-    s_inds = sorted(pop, key=lambda iv: np.nansum(iv.fitness.wvalues), reverse=True)
+    s_inds = sortByWeightedFitness(pop)
 
     mu = len(pop)
 
@@ -106,16 +106,13 @@ def selRank(pop, k, s=1.5):
     P_indiv.reverse()
 
     sum_P = sum(P_indiv)
+    cumsum_P = np.cumsum(P_indiv)
 
+    # choose the first individual whose cumulative probability exceeds a uniform draw
     chosen = []
     for i in range(k):
         u = random.random() * sum_P
-        sum_ = 0
-        for i, ind in enumerate(s_inds):
-            sum_ += P_indiv[i]
-            if sum_ > u:
-                chosen.append(ind)
-                break
+        chosen.append(s_inds[min(np.searchsorted(cumsum_P, u, side="right"), mu - 1)])
     return chosen
 
 
@@ -151,7 +148,19 @@ def selBest_multiObj(pop, k):
     This function accept multiobjective function by summing the fitness all of objectives.
     """
     # Sort individual according to their rank, the first indiv in the list is the one with the best fitness
-    return sorted(pop, key=lambda iv: np.nansum(iv.fitness.wvalues), reverse=True)[:k]
+    return sortByWeightedFitness(pop)[:k]
+
+
+def sortByWeightedFitness(pop):
+    """
+    Sort a population by the sum of the weighted fitness values of each individual (ignoring NaNs),
+    the best individual first. The sums of the whole population are computed at once.
+    """
+    if len(pop) == 0:
+        return []
+    wsums = np.nansum(np.array([iv.fitness.wvalues for iv in pop], dtype=np.float64).reshape(len(pop), -1), axis=1)
+    order = sorted(range(len(pop)), key=wsums.__getitem__, reverse=True)
+    return [pop[i] for i in order]
 
 
 # ### Crossover operators ###
@@ -300,6 +309,34 @@ def cxUniform_normDraw_adapt(ind1, ind2, indpb):
     return ind1, ind2
 
 
+def cxBlend_pairs(pop, alpha):
+    """Executes a blend crossover (see :func:`deap.tools.cxBlend`) on all consecutive pairs of
+    individuals of a population at once, which modifies the individuals in place. If the population
+    has an odd number of individuals, the last one is left unchanged.
+
+    :param pop: Population, the individuals 0 and 1, 2 and 3, ... are mated
+    :type pop: list
+    :param alpha: Extent of the interval in which the new values can be drawn for each attribute on both side of the parents' attributes.
+    :type alpha: float
+    :return: Population with the mated individuals
+    :rtype: list
+
+    This function uses the :func:`~numpy.random.random` function from :mod:`numpy`.
+    """
+    nPairs = len(pop) // 2
+    if nPairs == 0:
+        return pop
+    values = np.asarray(pop[: 2 * nPairs], dtype=np.float64)
+    ind1, ind2 = values[0::2], values[1::2]
+    gamma = (1.0 + 2.0 * alpha) * np.random.random(ind1.shape) - alpha
+    new1 = ((1.0 - gamma) * ind1 + gamma * ind2).tolist()
+    new2 = (gamma * ind1 + (1.0 - gamma) * ind2).tolist()
+    for i in range(nPairs):
+        pop[2 * i][:] = new1[i]  # in-place modification!
+        pop[2 * i + 1][:] = new2[i]
+    return pop
+
+
 ### Mutation operators ###
 
 # Adaptive mutation with m different stepsizes
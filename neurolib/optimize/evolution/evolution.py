@@ -3,6 +3,7 @@ import os
 import logging
 import multiprocessing
 import sys
+import weakref
 
 import deap
 from deap import base
@@ -109,13 +110,18 @@ class Evolution:
 
         # initialize pypet environment
         # env = pp.Environment(trajectory=trajectoryName, filename=trajectoryFileName)
+        # a pool of `ncores` processes evaluates all individuals of a generation instead of
+        # starting a new process for every individual. With a frozen input, the evaluation function
+        # and the trajectory are handed to every worker only once, when the pool is started.
         env = pp.Environment(
             trajectory=trajectoryName,
             filename=trajectoryFileName,
-            use_pool=False,
+            use_pool=True,
+            freeze_input=True,
             multiproc=True,
             ncores=ncores,
-            complevel=9,
+            # higher zlib levels cost a lot of time for storing the outputs and barely reduce the file size
+            complevel=4,
             log_config=paths.PYPET_LOGGING_CONFIG,
         )
 
@@ -229,11 +235,28 @@ class Evolution:
 
         # population history: dict of all valid individuals per generation
         self.history = {}
+        # genealogy of all individuals, filled generation by generation
+        self.tree = {}
+        self.id_genx = {}
+        self.id_score = {}
 
         # initialize population
         self.evaluationCounter = 0
         self.last_id = 0
 
+        # evaluated individuals by their parameters, see evalPopulationUsingPypet()
+        self._fitnessCache = weakref.WeakValueDictionary()
+        # scores of the last call of getScoresDuringEvolution()
+        self._scoresCache = None
+
+    def __getstate__(self):
+        # the cache of evaluated individuals and the parameters of a running generation
+        # are not saved with the evolution, see saveEvolution()
+        state = self.__dict__.copy()
+        state.pop("_fitnessCache", None)
+        state.pop("_modelParamsSnapshot", None)
+        return state
+
     def run(self, verbose=False):
         """Run the evolution or continue previous evolution. If evolution was not initialized first
         using `runInitial()`, this will be done.
@@ -279,9 +302,24 @@ class Evolution:
         :rtype: `neurolib.models.model.Model`
         """
         model = self.model
+        # while a generation is evaluated, a pool worker runs several individuals in a row with the
+        # same model, every run starts from the parameters the model had when the generation was started
+        snapshot = getattr(self, "_modelParamsSnapshot", None)
+        if snapshot is not None:
+            model.params = type(snapshot)(snapshot)
         model.params.update(self.individualToDict(self.getIndividualFromTraj(traj)))
         return model
 
+    def _getFitnessCacheKey(self, individual):
+        """Returns the key of an individual in the fitness cache, which is given by its (rounded) parameters.
+
+        :param individual: Individual (`DEAP` type)
+        :type individual: `deap.creator.Individual`
+        :return: Rounded parameters of this individual
+        :rtype: tuple
+        """
+        return tuple(round(float(x), 10) for x in individual[: len(self.paramInterval)])
+
     def individualToDict(self, individual):
         """Convert an individual to a parameter dictionary.
         
@@ -290,7 +328,8 @@ class Evolution:
         :return: Parameter dictionary of this individual
         :rtype: dict
         """
-        return self.ParametersInterval(*(individual[: len(self.paramInterval)]))._asdict().copy()
+        fieldNames = self.paramInterval._fields
+        return dict(zip(fieldNames, individual[: len(fieldNames)]))
 
     def initPypetTrajectory(self, traj, paramInterval, POP_SIZE, NGEN, model):
         """Initializes pypet trajectory and store all simulation parameters for later analysis.
@@ -365,8 +404,13 @@ class Evolution:
         :param individualGenerator: Function that generates individuals
         """
         # ------------- register everything in deap
-        deap.creator.create("FitnessMulti", deap.base.Fitness, weights=tuple(weightList))
-        deap.creator.create("Individual", list, fitness=deap.creator.FitnessMulti)
+        # the classes live globally in deap.creator, only (re)create them if the weights have changed,
+        # so that several evolutions with the same weights share the same classes
+        if getattr(getattr(deap.creator, "FitnessMulti", None), "weights", None) != tuple(weightList) or not hasattr(
+            deap.creator, "Individual"
+        ):
+            deap.creator.create("FitnessMulti", deap.base.Fitness, weights=tuple(weightList))
+            deap.creator.create("Individual", list, fitness=deap.creator.FitnessMulti)
 
         # initially, each individual has randomized genes
         # need to create a lambda funciton because du.generateRandomParams wants an argument but
@@ -411,40 +455,63 @@ class Evolution:
         # Add as many explored runs as individuals that need to be evaluated.
         # Furthermore, add the individuals as explored parameters.
         # We need to convert them to lists or write our own custom IndividualParameter ;-)
-        # Note the second argument to `cartesian_product`:
-        # This is for only having the cartesian product
-        # between ``generation x (ind_idx AND individual)``, so that every individual has just one
-        # unique index within a generation.
-
-        # this function is necessary for the NSGA-2 algorithms because
-        # some operators return np.float64 instead of float and pypet
+        # Every run pairs the id of an individual with its parameters, all runs belong to the
+        # current generation, so that every individual has just one unique index within a generation.
+
+        # individuals with the same parameters as an already evaluated individual that is still
+        # in memory (e.g. in self.history) are not simulated again, their fitness and outputs are
+        # taken from it. The cache only holds weak references, so that the outputs of individuals
+        # that are discarded are still freed. Individuals with the same parameters within this
+        # population are only simulated once.
+        # loaded evolutions have no cache yet, see __getstate__()
+        if getattr(self, "_fitnessCache", None) is None:
+            self._fitnessCache = weakref.WeakValueDictionary()
+        evalGroups = {}
+        for ind in pop:
+            key = self._getFitnessCacheKey(ind)
+            evaluated = self._fitnessCache.get(key)
+            if evaluated is not None and evaluated.fitness.valid:
+                self._setFitness(ind, evaluated.fitness.values, evaluated.outputs)
+            else:
+                evalGroups.setdefault(key, []).append(ind)
+        evalPop = [inds[0] for inds in evalGroups.values()]
+
+        if len(evalPop) == 0:
+            self._setScores(pop)
+            return pop
+
+        # the individuals are converted to lists of floats in one go. This is necessary for the NSGA-2
+        # algorithms because some operators return np.float64 instead of float and pypet
         # does not like individuals with mixed types... sigh.
-        def _cleanIndividual(ind):
-            return [float(i) for i in ind]
+        individuals = np.asarray(evalPop, dtype=np.float64).tolist()
 
         traj.f_expand(
-            pp.cartesian_product(
-                {
-                    "generation": [gIdx],
-                    "id": [x.id for x in pop],
-                    "individual": [list(_cleanIndividual(x)) for x in pop],
-                },
-                [("id", "individual"), "generation"],
-            )
-        )  # the current generation  # unique id of each individual
+            {
+                "generation": [gIdx] * len(evalPop),  # the current generation
+                "id": [x.id for x in evalPop],  # unique id of each individual
+                "individual": individuals,
+            }
+        )
 
         # increment the evaluationCounter
-        self.evaluationCounter += len(pop)
+        self.evaluationCounter += len(evalPop)
+
+        # the model parameters are restored from this (shallow) copy before each run, see getModelFromTraj()
+        if self.model is not None:
+            self._modelParamsSnapshot = type(self.model.params)(self.model.params)
 
         # run simulations for one generation
-        evolutionResult = toolbox.map(toolbox.evaluate)
+        try:
+            evolutionResult = toolbox.map(toolbox.evaluate)
+        finally:
+            self._modelParamsSnapshot = None
 
         # This error can have different reasons but is most likely
         # due to multiprocessing problems. One possibility is that your evaluation
         # funciton is not pickleable or that it returns an object that is not pickleable.
         assert len(evolutionResult) > 0, "No results returned from simulations."
 
-        for idx, result in enumerate(evolutionResult):
+        for (key, inds), result in zip(evalGroups.items(), evolutionResult):
             runIndex, packedReturnFromEvalFunction = result
 
             # packedReturnFromEvalFunction is the return from the evaluation function
@@ -455,18 +522,34 @@ class Evolution:
 
             fitnessesResult, returnedOutputs = packedReturnFromEvalFunction
 
-            # store simulation outputs
-            pop[idx].outputs = returnedOutputs
+            for ind in inds:
+                self._setFitness(ind, fitnessesResult, returnedOutputs)
+            self._fitnessCache[key] = inds[0]
 
-            # store fitness values
-            pop[idx].fitness.values = fitnessesResult
-
-            # compute score
-            pop[idx].fitness.score = np.ma.masked_invalid(pop[idx].fitness.wvalues).sum() / (
-                len(pop[idx].fitness.wvalues)
-            )
+        self._setScores(pop)
         return pop
 
+    def _setFitness(self, ind, fitnessesResult, returnedOutputs):
+        """Store the fitness and simulation outputs of an evaluated individual."""
+        # store simulation outputs
+        ind.outputs = returnedOutputs
+
+        # store fitness values
+        ind.fitness.values = fitnessesResult
+
+    def _setScores(self, pop):
+        """Compute the score of all evaluated individuals, which is the mean of the finite weighted
+        fitness values. Individuals without any finite fitness value get a score of nan.
+        """
+        if len(pop) == 0:
+            return
+        wvalues = np.array([p.fitness.wvalues for p in pop], dtype=np.float64)
+        isFinite = np.isfinite(wvalues)
+        scores = np.where(isFinite, wvalues, 0.0).sum(axis=1) / wvalues.shape[1]
+        scores[~isFinite.any(axis=1)] = np.nan
+        for p, score in zip(pop, scores):
+            p.fitness.score = score
+
     def getValidPopulation(self, pop=None):
         """Returns a list of the valid population.
 
@@ -476,7 +559,7 @@ class Evolution:
         :rtype: list
         """
         pop = pop or self.pop
-        return [p for p in pop if not (np.isnan(p.fitness.values).any() or np.isinf(p.fitness.values).any())]
+        return [p for p, valid in zip(pop, self._validityMask(pop)) if valid]
 
     def getInvalidPopulation(self, pop=None):
         """Returns a list of the invalid population.
@@ -487,7 +570,14 @@ class Evolution:
         :rtype: list
         """
         pop = pop or self.pop
-        return [p for p in pop if np.isnan(p.fitness.values).any() or np.isinf(p.fitness.values).any()]
+        return [p for p, valid in zip(pop, self._validityMask(pop)) if not valid]
+
+    def _validityMask(self, pop):
+        """Returns a boolean array that is True for all individuals of `pop` with only finite fitness values."""
+        if len(pop) == 0:
+            return np.zeros(0, dtype=bool)
+        fitnesses = np.array([p.fitness.values for p in pop], dtype=np.float64).reshape(len(pop), -1)
+        return np.isfinite(fitnesses).all(axis=1)
 
     def tagPopulation(self, pop):
         """Take a fresh population and add id's and attributes such as parameters that we can use later
@@ -503,9 +593,8 @@ class Evolution:
             ind.gIdx = self.gIdx
             ind.simulation_stored = False
             ind_dict = self.individualToDict(ind)
-            for key, value in ind_dict.items():
-                # set the parameters as attributes for easy access
-                setattr(ind, key, value)
+            # set the parameters as attributes for easy access
+            ind.__dict__.update(ind_dict)
             ind.params = ind_dict
             # increment id counter
             self.last_id += 1
@@ -541,6 +630,7 @@ class Evolution:
 
         # populate history for tracking
         self.history[self.gIdx] = self.pop  # self.getValidPopulation(self.pop)
+        self._addToEvolutionTree(self.pop)
 
         self._t_end_initial_population = datetime.datetime.now()
 
@@ -552,9 +642,10 @@ class Evolution:
         self._t_start_evolution = datetime.datetime.now()
         for self.gIdx in range(self.gIdx + 1, self.gIdx + self.traj.NGEN):
             # ------- Weed out the invalid individuals and replace them by random new indivuals -------- #
-            validpop = self.getValidPopulation(self.pop)
+            isValid = self._validityMask(self.pop)
+            validpop = [p for p, valid in zip(self.pop, isValid) if valid]
             # replace invalid individuals
-            invalidpop = self.getInvalidPopulation(self.pop)
+            invalidpop = [p for p, valid in zip(self.pop, isValid) if not valid]
 
             logging.info("Replacing {} invalid individuals.".format(len(invalidpop)))
             newpop = self.toolbox.population(n=len(invalidpop))
@@ -567,8 +658,13 @@ class Evolution:
             )
 
             ##### cross-over ####
+            # the default blend crossover is done for all pairs at once
+            matePairwise = self.matingOperator is not tools.cxBlend
+            if not matePairwise:
+                du.cxBlend_pairs(offspring, **self.MATE_P)
             for i in range(1, len(offspring), 2):
-                offspring[i - 1], offspring[i] = self.toolbox.mate(offspring[i - 1], offspring[i], **self.MATE_P)
+                if matePairwise:
+                    offspring[i - 1], offspring[i] = self.toolbox.mate(offspring[i - 1], offspring[i], **self.MATE_P)
                 # delete fitness inherited from parents
                 del offspring[i - 1].fitness.values, offspring[i].fitness.values
                 del offspring[i - 1].fitness.wvalues, offspring[i].fitness.wvalues
@@ -589,16 +685,22 @@ class Evolution:
 
             # ------- Evaluate next generation -------- #
 
-            self.pop = offspring + newpop
-            self.evalPopulationUsingPypet(self.traj, self.toolbox, offspring + newpop, self.gIdx)
+            # self.pop has to hold the new individuals before they are evaluated,
+            # getIndividualFromTraj() looks them up there by their id
+            nextpop = offspring + newpop
+            self.pop = nextpop
+            self.evalPopulationUsingPypet(self.traj, self.toolbox, nextpop, self.gIdx)
 
             # log individuals
-            self.history[self.gIdx] = validpop + offspring + newpop  # self.getValidPopulation(self.pop)
+            candidates = validpop + nextpop
+            self.history[self.gIdx] = candidates  # self.getValidPopulation(self.pop)
+            # validpop has been added to the tree in a previous generation already
+            self._addToEvolutionTree(nextpop)
 
             # ------- Select surviving population -------- #
 
             # select next generation
-            self.pop = self.toolbox.select(validpop + offspring + newpop, k=self.traj.popsize, **self.SELECT_P)
+            self.pop = self.toolbox.select(candidates, k=self.traj.popsize, **self.SELECT_P)
 
             # ------- END OF ROUND -------
 
@@ -627,8 +729,6 @@ class Evolution:
         self.traj.f_store()  # We switched off automatic storing, so we need to store manually
         self._t_end_evolution = datetime.datetime.now()
 
-        self.buildEvolutionTree()
-
     def buildEvolutionTree(self):
         """Builds a genealogy tree that is networkx compatible.
 
@@ -644,16 +744,26 @@ class Evolution:
             plt.figure(figsize=(8, 8))
             nx.draw(G, pos, node_size=50, alpha=0.5, node_color=list(evolution.genx.values()), with_labels=False)
             plt.show()
+
+        The tree is kept up to date during the evolution, calling this method rebuilds it from `self.history`.
         """
         self.tree = dict()
         self.id_genx = dict()
         self.id_score = dict()
 
         for gen, pop in self.history.items():
-            for p in pop:
-                self.tree[p.id] = p.parentIds if hasattr(p, "parentIds") else ()
-                self.id_genx[p.id] = p.gIdx
-                self.id_score[p.id] = p.fitness.score
+            self._addToEvolutionTree(pop)
+
+    def _addToEvolutionTree(self, pop):
+        """Adds the individuals of a population to the genealogy tree (see `buildEvolutionTree()`).
+
+        :param pop: Evaluated individuals
+        :type pop: list
+        """
+        for p in pop:
+            self.tree[p.id] = p.parentIds if hasattr(p, "parentIds") else ()
+            self.id_genx[p.id] = p.gIdx
+            self.id_score[p.id] = p.fitness.score
 
     def info(self, plot=True, bestN=5, info=True, reverse=False):
         """Print and plot information about the evolution and the current population
@@ -704,7 +814,8 @@ class Evolution:
         import dill
 
         fname = fname or os.path.join("data/", "evolution-" + self.trajectoryName + ".dill")
-        dill.dump(self, open(fname, "wb"))
+        with open(fname, "wb") as f:
+            dill.dump(self, f)
         logging.info(f"Saving evolution to {fname}")
 
     def loadEvolution(self, fname):
@@ -726,7 +837,8 @@ class Evolution:
         """
         import dill
 
-        evolution = dill.load(open(fname, "rb"))
+        with open(fname, "rb") as f:
+            evolution = dill.load(f)
 
         # parameter space is not saved correctly in dill, don't know why
         # that is why we recreate it using the values of
@@ -769,27 +881,22 @@ class Evolution:
         """
         # add the current population to the dataframe
         validPop = self.getValidPopulation(self.pop)
-        indIds = [p.id for p in validPop]
-        popArray = np.array([p[0 : len(self.paramInterval._fields)] for p in validPop]).T
+        popArray = np.array([p[0 : len(self.paramInterval._fields)] for p in validPop])
 
-        dfPop = pd.DataFrame(popArray, index=self.parameterSpace.parameterNames).T
+        dfPop = pd.DataFrame(popArray, columns=self.parameterSpace.parameterNames)
 
         # add more information to the dataframe
-        scores = self.getScores()
-        dfPop["score"] = scores
-        dfPop["id"] = indIds
+        dfPop["score"] = self.getScores()
+        dfPop["id"] = [p.id for p in validPop]
         dfPop["gen"] = [p.gIdx for p in validPop]
 
         # add fitness columns
         # NOTE: when loading an evolution with dill using loadingEvolution
         # MultiFitness values dissappear and only one is left.
         # See dfEvolution() for a solution using wvalues
-        n_fitnesses = len(validPop[0].fitness.values)
-        for i in range(n_fitnesses):
-            for ip, p in enumerate(validPop):
-                column_name = "f" + str(i)
-                dfPop.loc[ip, column_name] = p.fitness.values[i]
-        return dfPop
+        fitnesses = np.array([p.fitness.values for p in validPop])
+        dfFitness = pd.DataFrame(fitnesses, columns=[f"f{i}" for i in range(fitnesses.shape[1])])
+        return pd.concat([dfPop, dfFitness], axis=1)
 
     @property
     def dfEvolution(self):
@@ -838,8 +945,10 @@ class Evolution:
     def getScores(self):
         """Returns the scores of the current valid population
         """
-        validPop = self.getValidPopulation(self.pop)
-        return np.array([pop.fitness.score for pop in validPop])
+        isValid = self._validityMask(self.pop)
+        return np.fromiter(
+            (p.fitness.score for p, valid in zip(self.pop, isValid) if valid), dtype=np.float64, count=isValid.sum(),
+        )
 
     def getScoresDuringEvolution(self, traj=None, drop_first=True, reverse=False):
         """Get the scores of each generation's population.
@@ -850,30 +959,43 @@ class Evolution:
         :type drop_first: bool, optional
         :param reverse: Reverse the order of each generation. This is a necessary workaraound because loading from the an hdf file returns the generations in a reversed order compared to loading each generation from the pypet trajectory in memory, defaults to False
         :type reverse: bool, optional
-        :return: Tuple of list of all generations and an array of the scores of all individuals
-        :rtype: tuple[list, numpy.ndarray]
+        :return: Tuple of an array of all generation indices and an array of the scores of all individuals
+        :rtype: tuple[numpy.ndarray, numpy.ndarray]
         """
         if traj == None:
             traj = self.traj
 
-        generation_names = list(traj.results.evolution.f_to_dict(nested=True).keys())
+        # only the names of the generation groups are needed, the results are not walked here
+        generations = traj.results.evolution.f_get_children(copy=False)
+        generation_names = list(generations.keys())
 
         if reverse:
             generation_names = generation_names[::-1]
-        if drop_first and "gen_000000" in generation_names:
-            generation_names.remove("gen_000000")
-
-        npop = len(traj.results.evolution[generation_names[0]].scores)
-
-        gens = []
+        if drop_first:
+            generation_names = [r for r in generation_names if r != "gen_000000"]
+        offset = 1 if drop_first else 0
+
+        # the scores of a stored generation do not change, so the last result can be reused
+        # as long as the trajectory and its generations are the same
+        cacheKey = (tuple(generation_names), offset)
+        cached = getattr(self, "_scoresCache", None)
+        if cached is not None and cached[0] is traj and cached[1] == cacheKey:
+            return cached[2].copy(), cached[3].copy()
+
+        # load the scores of all generations that are not in memory yet in one go, otherwise
+        # the trajectory loads them from the hdf file one generation at a time
+        scoreResults = [generations[r].f_get("scores") for r in generation_names]
+        notLoaded = [result for result in scoreResults if result.f_is_empty()]
+        if len(notLoaded) > 0:
+            traj.f_load_items(notLoaded)
+
+        npop = len(scoreResults[0].f_get())
+
+        gens = np.arange(offset, offset + len(generation_names))
         all_scores = np.empty((len(generation_names), npop))
 
-        for i, r in enumerate(generation_names):
-            gens.append(i)
-            scores = traj.results.evolution[r].scores
-            all_scores[i] = scores
-
-        if drop_first:
-            gens = np.add(gens, 1)
+        for i, result in enumerate(scoreResults):
+            all_scores[i] = result.f_get()
 
-        return gens, all_scores
+        self._scoresCache = (traj, cacheKey, gens, all_scores)
+        return gens.copy(), all_scores.copy()
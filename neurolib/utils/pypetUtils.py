@@ -1,4 +1,3 @@
-import h5py
 import pypet
 import pathlib
 import logging
@@ -17,6 +16,8 @@ def getTrajectorynamesInFile(filename):
     :return: List of strings containing the trajectory names
     :rtype: list[str]
     """
+    import h5py
+
     assert pathlib.Path(filename).exists(), f"{filename} does not exist!"
     hdf = h5py.File(filename)
     all_traj_names = list(hdf.keys())
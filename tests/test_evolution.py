@@ -4,6 +4,7 @@ import sys
 import unittest
 import pytest
 
+import deap
 import numpy as np
 
 from neurolib.models.aln import ALNModel
@@ -41,9 +42,85 @@ class TestVanillaEvolution(unittest.TestCase):
         )
         evolution.run(verbose=False)
 
+        # the genealogy tree kept during the evolution equals the one rebuilt from the history
+        tree, id_genx, id_score = evolution.tree, evolution.id_genx, evolution.id_score
+        evolution.buildEvolutionTree()
+        self.assertEqual(tree, evolution.tree)
+        self.assertEqual(id_genx, evolution.id_genx)
+        self.assertEqual(id_score, evolution.id_score)
+
+        # individuals that have been evaluated before are not simulated again
+        nEvaluations = evolution.evaluationCounter
+        pop = [evolution.toolbox.clone(p) for p in evolution.pop]
+        for p in pop:
+            del p.fitness.values
+        evolution.evalPopulationUsingPypet(evolution.traj, evolution.toolbox, pop, evolution.gIdx)
+        self.assertEqual(evolution.evaluationCounter, nEvaluations)
+        for p, q in zip(pop, evolution.pop):
+            self.assertEqual(p.fitness.values, q.fitness.values)
+
+        # the cache is not saved with the evolution, a loaded evolution evaluates again
+        self.assertNotIn("_fitnessCache", evolution.__getstate__())
+        del evolution._fitnessCache
+        for p in pop:
+            del p.fitness.values
+        evolution.evalPopulationUsingPypet(evolution.traj, evolution.toolbox, pop, evolution.gIdx)
+        self.assertGreater(evolution.evaluationCounter, nEvaluations)
+        for p, q in zip(pop, evolution.pop):
+            self.assertEqual(p.fitness.values, q.fitness.values)
+
         end = time.time()
         logging.info("\t > Done in {:.2f} s".format(end - start))
 
+    def test_creator_classes(self):
+        logging.info("\t > Evolution: Testing that the deap classes are reused for the same weights ...")
+
+        def evo(traj):
+            return (1,), {}
+
+        pars = ParameterSpace(["x"], [[0.0, 4.0]])
+        Evolution(evo, pars, weightList=[-1.0], filename="test_creator_classes.hdf")
+        Individual = deap.creator.Individual
+        Evolution(evo, pars, weightList=[-1.0], filename="test_creator_classes.hdf")
+        self.assertIs(deap.creator.Individual, Individual)
+        Evolution(evo, pars, weightList=[1.0], filename="test_creator_classes.hdf")
+        self.assertIsNot(deap.creator.Individual, Individual)
+        self.assertEqual(deap.creator.FitnessMulti.weights, (1.0,))
+
+    def test_model_params_not_carried_over(self):
+        logging.info("\t > Evolution: Testing that model parameters are reset for every individual ...")
+        model = ALNModel()
+        duration = model.params["duration"]
+
+        def change_duration(traj):
+            model = evolution.getModelFromTraj(traj)
+            # fitness is zero if this run sees the original duration
+            computation_result = abs(model.params["duration"] - duration)
+            model.params["duration"] = duration / 2.0
+            return (computation_result,), {}
+
+        pars = ParameterSpace(["mue_ext_mean", "mui_ext_mean"], [[0.0, 4.0], [0.0, 4.0]])
+        evolution = Evolution(
+            change_duration,
+            pars,
+            model=model,
+            weightList=[-1.0],
+            POP_INIT_SIZE=8,
+            POP_SIZE=8,
+            NGEN=2,
+            ncores=2,
+            filename="test_model_params_not_carried_over.hdf",
+        )
+        evolution.run(verbose=False)
+        for gen, pop in evolution.history.items():
+            for p in pop:
+                self.assertEqual(p.fitness.values, (0.0,))
+
+        # outside of the evaluation of a generation, the current parameters of the model are used
+        model.params["duration"] = 12345.0
+        self.assertEqual(evolution.getModelFromTraj(evolution.pop[0]).params["duration"], 12345.0)
+        self.assertNotIn("_modelParamsSnapshot", evolution.__getstate__())
+
 
 class TestALNEvolution(unittest.TestCase):
     """Evolution with ALN model
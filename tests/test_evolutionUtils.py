@@ -95,3 +95,9 @@ class TestEvolutionCrossover(unittest.TestCase):
         du.cxNormDraw_adapt(ind1, ind2, 0.4)
         du.cxUniform_adapt(ind1, ind2, 0.4)
         du.cxUniform_normDraw_adapt(ind1, ind2, 0.4)
+
+        # the blend crossover of all pairs keeps the sum of each pair of parents
+        pop = [evolution.toolbox.clone(p) for p in init_pop[:4]]
+        du.cxBlend_pairs(pop, alpha=0.5)
+        for i in range(0, 4, 2):
+            self.assertTrue(np.allclose(np.add(pop[i], pop[i + 1]), np.add(init_pop[i], init_pop[i + 1])))
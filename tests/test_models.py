@@ -1,8 +1,10 @@
+import copy
 import logging
 import time
 import unittest
 
 from neurolib.models.aln import ALNModel
+from neurolib.models.aln.timeIntegration import timeIntegration, timeIntegration_njit_elementwise
 from neurolib.models.fhn import FHNModel
 from neurolib.models.hopf import HopfModel
 from neurolib.models.thalamus import ThalamicMassModel
@@ -52,6 +54,62 @@ class TestAln(unittest.TestCase):
         end = time.time()
         logging.info("\t > Done in {:.2f} s".format(end - start))
 
+    def test_max_delay(self):
+        logging.info("\t > ALN: Testing maximum delay ...")
+        ds = Dataset("gw")
+        aln = ALNModel(Cmat=ds.Cmat, Dmat=ds.Dmat)
+        maxDelay = aln.getMaxDelay()
+        self.assertEqual(aln.getMaxDelay(), maxDelay)
+
+        # changing a delay parameter or editing the length matrix in place changes the delays
+        aln.params["signalV"] = aln.params["signalV"] / 2.0
+        self.assertGreater(aln.getMaxDelay(), maxDelay)
+        maxDelay = aln.getMaxDelay()
+        aln.params["lengthMat"] *= 3
+        self.assertGreater(aln.getMaxDelay(), 2 * maxDelay)
+
+        # the delay matrix of a run is not left in the parameters, integrating outside of run() uses the current delays
+        aln = ALNModel(Cmat=ds.Cmat, Dmat=ds.Dmat, seed=42)
+        aln.params["duration"] = 10.0
+        aln.run()
+        self.assertNotIn("Dmat_ndt", aln.params)
+        aln.params["signalV"] = 0.0
+        rates_exc = aln.integration(aln.params)[1]
+        self.assertTrue((rates_exc == timeIntegration(aln.params)[1]).all())
+
+    def test_sparse_coupling(self):
+        logging.info("\t > ALN: Testing sparse coupling ...")
+        ds = Dataset("gw")
+        Cmat = ds.Cmat.copy()
+        Cmat[Cmat < 0.1 * Cmat.max()] = 0
+        rates = []
+        for sparse_threshold in [1.0, 0.0]:
+            aln = ALNModel(Cmat=Cmat, Dmat=ds.Dmat, seed=42)
+            aln.params["duration"] = 0.2 * 1000
+            aln.params["sparse_threshold"] = sparse_threshold
+            aln.run()
+            rates.append(aln.rates_exc)
+        # skipping the zero entries of Cmat must not change the result
+        self.assertTrue((rates[0] == rates[1]).all())
+
+    def test_single_kernel_signature(self):
+        logging.info("\t > ALN: Testing that the kernel is compiled only once ...")
+        ds = Dataset("gw")
+        aln = ALNModel()
+        aln.params["duration"] = 10.0
+        aln.run()
+        signatures = timeIntegration_njit_elementwise.signatures
+        # different network sizes, delay structures, and chunkwise runs must reuse the same compiled kernel
+        aln = ALNModel(Cmat=ds.Cmat, Dmat=ds.Dmat)
+        aln.params["duration"] = 10.0
+        aln.run()
+        aln.params["signalV"] = 0.0
+        aln.run(chunkwise=True, chunksize=10)
+        # writeable copies of the shared, read-only lookup tables
+        aln.params = copy.deepcopy(aln.params)
+        aln.run()
+        self.assertEqual(timeIntegration_njit_elementwise.signatures, signatures)
+
 
 class TestHopf(unittest.TestCase):
     """